@@ -1,11 +1,18 @@
+import numpy as np
 import pandas as pd
 import folium
 from folium.plugins import HeatMap, MarkerCluster
-import json
+import hashlib
+import inspect
+import orjson
+import os
+import pickle
 
 import geopandas as gpd
-from folium import MacroElement
-from jinja2 import Template
+import shapely
+from shapely.geometry import shape
+from folium.elements import JSCSSMixin
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from folium.features import DivIcon
 
 # =========================
@@ -33,27 +40,32 @@ PURPLE = {"Nunavut", "Northwest Territories", "Yukon", "British Columbia"}
 GREEN  = {"Ontario", "Manitoba", "Saskatchewan", "Alberta", "Quebec"}
 ORANGE = {"Newfoundland and Labrador", "Prince Edward Island", "Nova Scotia", "New Brunswick"}
 
+NAME_TO_REGION = {
+    **{name: "Purple Region" for name in PURPLE},
+    **{name: "Green Region" for name in GREEN},
+    **{name: "Orange Region" for name in ORANGE},
+}
+
+# Provinces with at least this many sites draw them with Leaflet.glify (WebGL)
+# instead of the marker cluster, which stalls the browser at that size
+GLIFY_MIN_POINTS = 10000
+GLIFY_JS_URL = "https://unpkg.com/leaflet.glify@3.3.0/dist/glify-browser.js"
+
+# Douglas-Peucker tolerance (metres, Statistics Canada Lambert) for province borders
+SIMPLIFY_TOLERANCE_M = 2000
+
 REGION_COLOR = {
     "Purple Region": "purple",
     "Green Region": "green",
     "Orange Region": "orange",
 }
 
-def province_to_region(prov_name: str):
-    if prov_name in PURPLE:
-        return "Purple Region"
-    if prov_name in GREEN:
-        return "Green Region"
-    if prov_name in ORANGE:
-        return "Orange Region"
-    return None
-
-def add_count_marker(feature_group, lat, lon, count, color, tooltip):
-    # pointer-events:none makes it click-through
-    html = f"""
-    <div style="
+# Shared count-bubble styling, emitted once in the page header; each marker
+# only carries its class names (pointer-events:none makes it click-through)
+COUNT_MARKER_CSS = """
+<style>
+    .count-marker {
         pointer-events:none;
-        background:{color};
         border:2px solid black;
         border-radius:50%;
         width:46px; height:46px;
@@ -63,10 +75,13 @@ def add_count_marker(feature_group, lat, lon, count, color, tooltip):
         font-weight:bold;
         color:white;
         font-size:14px;
-        ">
-        {count}
-    </div>
-    """
+    }
+""" + "".join(
+    f"    .cm-{color} {{ background:{color}; }}\n" for color in REGION_COLOR.values()
+) + "</style>\n"
+
+def add_count_marker(feature_group, lat, lon, count, color, tooltip):
+    html = f'<div class="count-marker cm-{color}">{count}</div>'
     folium.Marker(
         location=[lat, lon],
         icon=DivIcon(html=html),
@@ -74,40 +89,92 @@ def add_count_marker(feature_group, lat, lon, count, color, tooltip):
         interactive=False  # also makes marker not capture clicks
     ).add_to(feature_group)
 
+# Drill-down JS (click_template.j2) is parsed once; the compiled bytecode is
+# cached in .jinja_cache so later runs skip Jinja's parse step
+os.makedirs(".jinja_cache", exist_ok=True)
+JINJA_ENV = Environment(
+    loader=FileSystemLoader("."),
+    bytecode_cache=FileSystemBytecodeCache(".jinja_cache"),
+)
+# |tojson (provPoints) goes through orjson; Jinja still applies its HTML-safe escaping
+JINJA_ENV.policies["json.dumps_function"] = lambda obj: orjson.dumps(obj).decode()
+JINJA_ENV.policies["json.dumps_kwargs"] = {}
+CLICK_TEMPLATE = JINJA_ENV.get_template("click_template.j2")
+
+class DrillDownScript(JSCSSMixin):
+    """Back button + drill-down JS (click_template.j2).
+
+    Leaflet.glify is only linked (in the header, after leaflet.js) when some
+    province reaches GLIFY_MIN_POINTS, so smaller pages never fetch it.
+    """
+
+    _template = CLICK_TEMPLATE
+
+    def __init__(self, use_glify=False):
+        super().__init__()
+        self._name = "DrillDownScript"
+        self.default_js = [("leaflet_glify", GLIFY_JS_URL)] if use_glify else []
+
 # =========================
 # LOAD + CLEAN DATA
 # =========================
 
+# Only the columns the map uses (names as they read after header cleanup below)
+SITE_COLUMNS = {"Site User 10-20-2025", "Site Name", "Latitude", "Longitude", "Category", "Province"}
+
 df = pd.read_excel(
     "10-20-2025_Site List.xlsx",
     sheet_name="10-20_Site List Raw",
-    engine="openpyxl"
+    engine="calamine",
+    usecols=lambda col: str(col).replace("\n", " ").strip() in SITE_COLUMNS,
 )
 
 df.columns = df.columns.str.replace("\n", " ").str.strip()
 
 valid_users = ["DFO", "Shared-DFO", "SCH"]
-df = df[df["Site User 10-20-2025"].isin(valid_users)]
-
-df = df.dropna(subset=["Latitude", "Longitude"])
-df = df[(df["Latitude"].between(41.7, 83.1)) & (df["Longitude"].between(-141.0, -52.6))]
 
-df["Category"] = pd.to_numeric(df["Category"], errors="coerce").fillna(0)
-
-# Province code column (adjust if your column name differs)
-df["ProvCode"] = df["Province"].astype(str).str.strip().str.upper()
+# Province code column (adjust if your column name differs).
+# Only a dozen distinct codes repeat across all rows, so clean the distinct
+# values once and broadcast them back with the factorized positions.
+prov_pos, prov_values = pd.factorize(df["Province"], use_na_sentinel=False)
+prov_codes = pd.Index(prov_values).astype(str).str.strip().str.upper()
 
 # Treat OC as BC (temporary rule)
-df["ProvCode"] = df["ProvCode"].replace({"OC": "BC"})
-
-# Convert to full names
-df["province_name"] = df["ProvCode"].map(CODE_TO_NAME)
+prov_codes = prov_codes.where(prov_codes != "OC", "BC")
+
+# Full names and regions for the distinct codes
+prov_names = prov_codes.map(CODE_TO_NAME)
+prov_regions = prov_names.map(NAME_TO_REGION)
+
+df["ProvCode"] = prov_codes.take(prov_pos)
+df["province_name"] = prov_names.take(prov_pos)
+df["region"] = prov_regions.take(prov_pos)
+
+# One combined mask: valid user, coordinates present and inside Canada's bbox,
+# valid province + region; the frame is copied once, here
+site_lat = df["Latitude"].to_numpy(dtype=float)
+site_lon = df["Longitude"].to_numpy(dtype=float)
+mask = (
+    np.isin(df["Site User 10-20-2025"].to_numpy(), valid_users)
+    & ~np.isnan(site_lat) & ~np.isnan(site_lon)
+    & (site_lat >= 41.7) & (site_lat <= 83.1)
+    & (site_lon >= -141.0) & (site_lon <= -52.6)
+    & df["province_name"].notna().to_numpy()
+    & df["region"].notna().to_numpy()
+)
+df = df.loc[mask].copy()
 
-# Assign region
-df["region"] = df["province_name"].apply(province_to_region)
+# Small integer enum; int8 keeps the weight lookup below to one byte per site.
+# Only cast when every value is a whole number in int8 range, so e.g. 1.5 or 300
+# keep their real value (and weight) instead of being truncated or wrapped.
+category = pd.to_numeric(df["Category"], errors="coerce").fillna(0)
+if ((category % 1 == 0) & category.between(-128, 127)).all():
+    category = category.astype("int8")
+df["Category"] = category
 
-# Keep only rows with valid province + region
-df = df[df["province_name"].notna() & df["region"].notna()].copy()
+# Categoricals so the groupbys below bucket by integer code instead of hashing strings
+df["province_name"] = df["province_name"].astype("category")
+df["region"] = df["region"].astype("category")
 
 # =========================
 # CREATE MAP
@@ -117,33 +184,99 @@ center_lat = df["Latitude"].mean()
 center_lon = df["Longitude"].mean()
 START_ZOOM = 4
 
-m = folium.Map(location=[center_lat, center_lon], zoom_start=START_ZOOM, tiles="OpenStreetMap")
+# prefer_canvas draws vector layers (site circles, polygons) on one <canvas> instead of SVG nodes
+m = folium.Map(
+    location=[center_lat, center_lon],
+    zoom_start=START_ZOOM,
+    tiles="OpenStreetMap",
+    prefer_canvas=True,
+)
+
+m.get_root().header.add_child(folium.Element(COUNT_MARKER_CSS))
 
 # =========================
 # LOAD GEOJSON
 # =========================
 
-with open("ca.json", "r", encoding="utf-8") as f:
-    canada_gj = json.load(f)
-
-prov_gdf = gpd.GeoDataFrame.from_features(canada_gj["features"])
-# Assumes GeoJSON has properties key "name"
-prov_gdf["name"] = prov_gdf["name"].astype(str).str.strip()
-
-prov_gdf["region"] = prov_gdf["name"].apply(province_to_region)
-prov_gdf = prov_gdf[prov_gdf["region"].notna()].copy()
+def build_boundaries(canada_gj):
+    """Simplified province + region frames and their lon/lat centroids."""
+    # Tag + filter the raw features in one pass and keep only name/region/geometry,
+    # rather than building a full property frame with from_features
+    names, regions, geoms = [], [], []
+    for feature in canada_gj["features"]:
+        # Assumes GeoJSON has properties key "name"
+        name = str(feature["properties"]["name"]).strip()
+        region = NAME_TO_REGION.get(name)
+        if region is None:
+            continue
+        names.append(name)
+        regions.append(region)
+        geoms.append(shape(feature["geometry"]))
+
+    prov_gdf = gpd.GeoDataFrame({"name": names, "region": regions}, geometry=geoms, crs="EPSG:4326")
+
+    # Simplify borders as one coverage so neighbouring provinces keep shared edges
+    prov_gdf["geometry"] = (
+        prov_gdf.geometry.to_crs(3347)
+        .simplify_coverage(SIMPLIFY_TOLERANCE_M)
+        .to_crs(4326)
+    )
 
-regions_gdf = prov_gdf.dissolve(by="region", as_index=False)
+    # The provinces form a valid coverage (no overlaps, shared edges match), so each
+    # region is merged with one coverage union instead of a general overlay union
+    regions_gdf = prov_gdf[["region", "geometry"]].dissolve(
+        by="region", as_index=False, sort=False, method="coverage"
+    )
 
-regions_geojson = json.loads(regions_gdf.to_json())
-provinces_geojson = json.loads(prov_gdf.to_json())
+    # lon/lat centroids via shapely, skipping geopandas' geographic-CRS warning
+    prov_centroids = shapely.centroid(prov_gdf.geometry.to_numpy())
+    region_centroids = shapely.centroid(regions_gdf.geometry.to_numpy())
+
+    return prov_gdf, regions_gdf, prov_centroids, region_centroids
+
+# ca.json rarely changes, so the processed boundaries are pickled under a key
+# derived from everything they depend on: the file, the simplify tolerance, the
+# region mapping, the pipeline code and the geopandas/shapely/GEOS versions
+with open("ca.json", "rb") as f:
+    ca_bytes = f.read()
+
+cache_hash = hashlib.sha256(ca_bytes)
+for part in (
+    str(SIMPLIFY_TOLERANCE_M),
+    orjson.dumps(NAME_TO_REGION, option=orjson.OPT_SORT_KEYS).decode(),
+    inspect.getsource(build_boundaries),
+    gpd.__version__,
+    shapely.__version__,
+    shapely.geos_version_string,
+):
+    cache_hash.update(b"\0" + part.encode())
+cache_path = f"_ca_cache_{cache_hash.hexdigest()[:16]}.pkl"
+
+boundaries = None
+if os.path.exists(cache_path):
+    try:
+        with open(cache_path, "rb") as f:
+            boundaries = pickle.load(f)
+    except Exception:
+        # Unreadable or written by incompatible library versions; rebuild it
+        boundaries = None
+
+if boundaries is None:
+    boundaries = build_boundaries(orjson.loads(ca_bytes))
+    with open(cache_path, "wb") as f:
+        pickle.dump(boundaries, f)
+
+prov_gdf, regions_gdf, prov_centroids, region_centroids = boundaries
+
+regions_geojson = regions_gdf.to_geo_dict()
+provinces_geojson = prov_gdf.to_geo_dict()
 
 # =========================
 # COUNTS
 # =========================
 
-counts_region = df.groupby("region").size().to_dict()
-counts_prov = df.groupby(["region", "province_name"]).size().to_dict()
+counts_region = df.groupby("region", sort=False, observed=True).size().to_dict()
+counts_prov = df.groupby(["region", "province_name"], sort=False, observed=True).size().to_dict()
 
 # =========================
 # COUNT MARKER LAYERS
@@ -162,33 +295,31 @@ prov_counts_layer_by_region = {
 }
 
 # Region count markers at region centroids
-regions_tmp = regions_gdf.copy()
-regions_tmp["centroid"] = regions_tmp.geometry.centroid
-
-for _, r in regions_tmp.iterrows():
-    reg = r["region"]
-    c = r["centroid"]
+for reg, cy, cx in zip(
+    regions_gdf["region"].to_numpy(),
+    shapely.get_y(region_centroids),
+    shapely.get_x(region_centroids),
+):
     count = counts_region.get(reg, 0)
     add_count_marker(
         region_counts_layer,
-        c.y, c.x,
+        cy, cx,
         count=count,
         color=REGION_COLOR[reg],
         tooltip=f"{reg}: {count} sites"
     )
 
 # Province count markers at province centroids (in separate layers)
-prov_tmp = prov_gdf.copy()
-prov_tmp["centroid"] = prov_tmp.geometry.centroid
-
-for _, pr in prov_tmp.iterrows():
-    reg = pr["region"]
-    prov_name = pr["name"]
-    c = pr["centroid"]
+for reg, prov_name, cy, cx in zip(
+    prov_gdf["region"].to_numpy(),
+    prov_gdf["name"].to_numpy(),
+    shapely.get_y(prov_centroids),
+    shapely.get_x(prov_centroids),
+):
     count = counts_prov.get((reg, prov_name), 0)
     add_count_marker(
         prov_counts_layer_by_region[reg],
-        c.y, c.x,
+        cy, cx,
         count=count,
         color=REGION_COLOR[reg],
         tooltip=f"{prov_name}: {count} sites"
@@ -239,202 +370,71 @@ region_layer = folium.GeoJson(
 # PROVINCE-SPECIFIC HEATMAP + MARKERS (hidden until province click)
 # =========================
 
-province_site_layers = {}  # province_name -> FeatureGroup
-
-for prov_name, sub in df.groupby("province_name"):
-    fg = folium.FeatureGroup(name=f"{prov_name} (sites + heat)", show=False).add_to(m)
-    province_site_layers[prov_name] = fg
-
-    heat_data = [
-        [row["Latitude"], row["Longitude"], 1 if row["Category"] == 1 else 0.2]
-        for _, row in sub.iterrows()
-    ]
-
-    HeatMap(
-        heat_data,
-        radius=11,
-        blur=10,
-        max_zoom=6,
-        min_opacity=0.4,
-        gradient={0.2: "green", 0.4: "yellow", 0.6: "orange", 1.0: "red"}
-    ).add_to(fg)
-
-    cluster = MarkerCluster().add_to(fg)
-    for _, row in sub.iterrows():
-        popup_text = (
-            f"Site: {row.get('Site Name', 'N/A')}<br>"
-            f"User: {row['Site User 10-20-2025']}<br>"
-            f"Category: {row['Category']}<br>"
-            f"Province: {prov_name}"
-        )
-        folium.Marker(
-            location=[row["Latitude"], row["Longitude"]],
-            popup=popup_text
-        ).add_to(cluster)
-
-prov_site_map = {prov: fg.get_name() for prov, fg in province_site_layers.items()}
-prov_site_map_json = json.dumps(prov_site_map)
+# Pull the columns out once as plain arrays; each province then just slices them
+lat = df["Latitude"].to_numpy()
+lon = df["Longitude"].to_numpy()
+cats = df["Category"].to_numpy()
+users = df["Site User 10-20-2025"].to_numpy()
+names = df["Site Name"].to_numpy() if "Site Name" in df.columns else np.full(len(df), "N/A", dtype=object)
+weights = np.where(cats == 1, 1.0, 0.2)
+
+idx_map = df.groupby("province_name", sort=False, observed=True).indices  # province_name -> positional indices
+
+# One heat layer + one marker cluster shared by every province; the drill-down JS
+# refills them from provPoints, so each site is embedded in the page only once.
+province_sites_layer = folium.FeatureGroup(name="Province sites (heat + markers)", show=False).add_to(m)
+
+province_heat = HeatMap(
+    [],
+    radius=11,
+    blur=10,
+    max_zoom=6,
+    min_opacity=0.4,
+    gradient={0.2: "green", 0.4: "yellow", 0.6: "orange", 1.0: "red"}
+).add_to(province_sites_layer)
+
+province_cluster = MarkerCluster(options={"chunkedLoading": True}).add_to(province_sites_layer)
+
+# province_name -> [[lat, lon, weight, user, category, site name], ...]
+prov_points = {
+    prov_name: list(zip(
+        lat[idx].tolist(),
+        lon[idx].tolist(),
+        weights[idx].tolist(),
+        users[idx].tolist(),
+        cats[idx].tolist(),
+        names[idx].tolist(),
+    ))
+    for prov_name, idx in idx_map.items()
+}
 
 # =========================
 # JS: Back button + Drill-down logic
 # =========================
 
-map_var = m.get_name()
-region_var = region_layer.get_name()
-provpoly_var = province_poly_layer.get_name()
-
-region_counts_var = region_counts_layer.get_name()
-prov_counts_purple_var = prov_counts_purple.get_name()
-prov_counts_green_var  = prov_counts_green.get_name()
-prov_counts_orange_var = prov_counts_orange.get_name()
-
-click_js = f"""
-{{% macro script(this, kwargs) %}}
-var provSiteMap = {prov_site_map_json};
-var currentRegion = null;
-
-// Layer helpers
-function removeLayerIfPresent(layerObj) {{
-  if (layerObj && {map_var}.hasLayer(layerObj)) {{
-    {map_var}.removeLayer(layerObj);
-  }}
-}}
-
-function addLayerIfMissing(layerObj) {{
-  if (layerObj && !{map_var}.hasLayer(layerObj)) {{
-    {map_var}.addLayer(layerObj);
-  }}
-}}
-
-function hideAllProvinceSiteLayers() {{
-  Object.keys(provSiteMap).forEach(function(provName) {{
-    var layerName = provSiteMap[provName];
-    var layerObj = window[layerName];
-    removeLayerIfPresent(layerObj);
-  }});
-}}
-
-function showProvinceSiteLayer(provName) {{
-  hideAllProvinceSiteLayers();
-  var layerName = provSiteMap[provName];
-  var layerObj = window[layerName];
-  addLayerIfMissing(layerObj);
-}}
-
-// Province polygons visibility
-function setProvincePolygonVisibility(targetRegion) {{
-  {provpoly_var}.eachLayer(function(layer) {{
-    var props = layer.feature && layer.feature.properties ? layer.feature.properties : {{}};
-    var isIn = (props.region === targetRegion);
-    layer.setStyle({{
-      fillOpacity: isIn ? 0.35 : 0.0,
-      weight: isIn ? 1 : 0
-    }});
-  }});
-}}
-
-function hideAllProvinceCounts() {{
-  removeLayerIfPresent(window["{prov_counts_purple_var}"]);
-  removeLayerIfPresent(window["{prov_counts_green_var}"]);
-  removeLayerIfPresent(window["{prov_counts_orange_var}"]);
-}}
-
-function showProvinceCountsForRegion(targetRegion) {{
-  hideAllProvinceCounts();
-  if (targetRegion === "Purple Region") addLayerIfMissing(window["{prov_counts_purple_var}"]);
-  if (targetRegion === "Green Region")  addLayerIfMissing(window["{prov_counts_green_var}"]);
-  if (targetRegion === "Orange Region") addLayerIfMissing(window["{prov_counts_orange_var}"]);
-}}
-
-// BACK button control
-var BackControl = L.Control.extend({{
-  options: {{ position: 'topright' }},
-  onAdd: function(map) {{
-    var container = L.DomUtil.create('div', 'leaflet-bar leaflet-control');
-    container.style.background = 'white';
-    container.style.padding = '6px 8px';
-    container.style.cursor = 'pointer';
-    container.style.fontSize = '14px';
-    container.style.userSelect = 'none';
-    container.innerHTML = '⬅ Back to Regions';
-
-    // prevent map dragging/zooming when clicking the button
-    L.DomEvent.disableClickPropagation(container);
-
-    container.onclick = function() {{
-      // Reset state
-      currentRegion = null;
-
-      // Show region counts
-      addLayerIfMissing(window["{region_counts_var}"]);
-
-      // Hide province counts
-      hideAllProvinceCounts();
-
-      // Hide provinces polygons
-      setProvincePolygonVisibility("__NONE__");
-
-      // Hide province site layers
-      hideAllProvinceSiteLayers();
-
-      // Reset view
-      map.setView([{center_lat}, {center_lon}], {START_ZOOM});
-    }};
-
-    return container;
-  }}
-}});
-{map_var}.addControl(new BackControl());
-
-// REGION click
-{region_var}.eachLayer(function(layer) {{
-  layer.on('click', function() {{
-    var targetRegion = layer.feature.properties.region;
-    {provpoly_var}.bringToFront();
-
-    {map_var}.fitBounds(layer.getBounds());
-
-    // hide region counts once drilled in
-    removeLayerIfPresent(window["{region_counts_var}"]);
-
-    // show province counts for that region
-    showProvinceCountsForRegion(targetRegion);
-
-    // reveal province polygons for that region
-    setProvincePolygonVisibility(targetRegion);
-
-    // hide any previously shown province sites
-    hideAllProvinceSiteLayers();
-  }});
-}});
-
-// PROVINCE polygon click
-// PROVINCE polygon click (always allowed)
-{provpoly_var}.eachLayer(function(layer) {{
-  layer.on('click', function() {{
-    var props = layer.feature.properties;
-    {provpoly_var}.bringToFront();
-
-    // Auto-select the province's region
-    currentRegion = props.region;
-
-    // Hide region counts and show province counts
-    removeLayerIfPresent(window["{region_counts_var}"]);
-    showProvinceCountsForRegion(currentRegion);
-
-    // Reveal provinces in this region
-    setProvincePolygonVisibility(currentRegion);
-
-    // Zoom and show this province's sites
-    {map_var}.fitBounds(layer.getBounds());
-    showProvinceSiteLayer(props.name);
-  }});
-}});
-{{% endmacro %}}
-"""
+macro = DrillDownScript(
+    use_glify=max(map(len, prov_points.values()), default=0) >= GLIFY_MIN_POINTS
+)
+macro.prov_points = prov_points
+
+macro.map_var = m.get_name()
+macro.region_var = region_layer.get_name()
+macro.provpoly_var = province_poly_layer.get_name()
+
+macro.region_counts_var = region_counts_layer.get_name()
+macro.prov_counts_purple_var = prov_counts_purple.get_name()
+macro.prov_counts_green_var  = prov_counts_green.get_name()
+macro.prov_counts_orange_var = prov_counts_orange.get_name()
+
+macro.sites_var = province_sites_layer.get_name()
+macro.heat_var = province_heat.get_name()
+macro.cluster_var = province_cluster.get_name()
+
+macro.center_lat = center_lat
+macro.center_lon = center_lon
+macro.start_zoom = START_ZOOM
+macro.glify_min_points = GLIFY_MIN_POINTS
 
-macro = MacroElement()
-macro._template = Template(click_js)
 m.get_root().add_child(macro)
 
 # =========================
@@ -459,8 +459,6 @@ m.get_root().html.add_child(folium.Element(legend_html))
 # SAVE
 # =========================
 
-import os
-
 # Ensure docs folder exists
 output_dir = "docs"
 os.makedirs(output_dir, exist_ok=True)